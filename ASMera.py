@@ -1,9 +1,43 @@
+from __future__ import annotations
+
 import sys
-from enum import Enum
-from typing import Tuple, TypeAlias
+import time
+
+# start-up time matters for short scripts: annotations are not evaluated, and
+# the optional features live in ASMera_features, imported only for options
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Iterable, Tuple, TypeAlias
+
+__version__ = "1.1.0"
 
 program_vars = dict()
 program_functions = dict()
+# values given on the command line, taking precedence over the ones of the
+# matching nombre declarations
+initial_values = dict()
+
+# one [position] frame per block being executed (function body or condition
+# body), innermost last. Outer positions point to the statement currently
+# running (a call or a condition), the innermost one to the next statement.
+call_stack = list()
+# number of bytes written to stdout by message statements, only counted when
+# checkpointing, capturing the output or running emit hooks
+output_offset = 0
+# set by ASMera_features when the matching option is given. When not None,
+# every emitted line is also written to the OutputCapture
+output_capture = None
+checkpointer = None
+effect_cache = None
+metrics = None
+# callbacks of the interpreter events, registered with add_hook
+parse_hooks = list()
+build_ast_hooks = list()
+run_hooks = list()
+call_hooks = list()
+return_hooks = list()
+statements_hooks = list()
+emit_hooks = list()
 
 
 class DeclareFunction:
@@ -56,16 +90,20 @@ class DeclareVar:
 
     def run(self):
         assert (self.name not in program_vars)
-        program_vars[self.name] = self.value
+        program_vars[self.name] = initial_values.get(self.name, self.value)
+
 
+class Comp:
+    # behaves like an Enum, without importing enum
+    def __init__(self, name: str, value: int):
+        self.name = name
+        self.value = value
 
-class Comp(Enum):
-    EQ = 1
-    NEQ = 2
-    LT = 3
-    LEQ = 4
-    GT = 5
-    GEQ = 6
+    def __repr__(self):
+        return f"<Comp.{self.name}: {self.value}>"
+
+    def __str__(self):
+        return f"Comp.{self.name}"
 
     def compare(self, left: int, right: int) -> bool:
         match self:
@@ -83,6 +121,14 @@ class Comp(Enum):
                 return left >= right
 
 
+Comp.EQ = Comp("EQ", 1)
+Comp.NEQ = Comp("NEQ", 2)
+Comp.LT = Comp("LT", 3)
+Comp.LEQ = Comp("LEQ", 4)
+Comp.GT = Comp("GT", 5)
+Comp.GEQ = Comp("GEQ", 6)
+
+
 class VarRef:
     def __init__(self, var_name: str):
         self.var_name = var_name
@@ -186,7 +232,7 @@ class Message:
                     previous_item_was_quoted = e.quoted
                     previous_item_was_var = False
 
-        print(s)
+        emit(s)
 
 
 Statement: TypeAlias = DeclareFunction | Return | CallFunction | Increment | DeclareVar | Condition | EndCondition | Message
@@ -305,24 +351,34 @@ def parse_line(line: str) -> Statement:
                 exit(-1)
 
 
+def parse_lines(lines: Iterable[str]) -> list[Statement]:
+    if parse_hooks:
+        start = time.perf_counter()
+    count = 0
+    statements = list()
+    for line in lines:
+        line = line.rstrip()
+        count += 1
+        if len(line) == 0:
+            # empty line, continue
+            continue
+        if line[0] == ';':
+            # comment, continue
+            continue
+        s = parse_line(line)
+        # print(s)
+        statements.append(s)
+
+    if parse_hooks:
+        seconds = time.perf_counter() - start
+        for hook in parse_hooks:
+            hook(seconds)
+    return statements
+
+
 def parse(filename: str) -> list[Statement]:
     with open(filename) as f:
-        count = 0
-        statements = list()
-        for line in f:
-            line = line.rstrip()
-            count += 1
-            if len(line) == 0:
-                # empty line, continue
-                continue
-            if line[0] == ';':
-                # comment, continue
-                continue
-            s = parse_line(line)
-            # print(s)
-            statements.append(s)
-
-        return statements
+        return parse_lines(f)
 
 
 def append_statement_to_fun_dict(statement: Statement, fun_name: str, fun_dict: dict[list[Statement]]):
@@ -366,9 +422,15 @@ def build_ast_helper(statements: list[Statement], ast_accumulator: list[Statemen
 
 
 def build_ast(statements: list[Statement]) -> list[Statement]:
+    if build_ast_hooks:
+        start = time.perf_counter()
     ret = build_ast_helper(statements, list())
     (remains, ast) = ret
     assert (remains == None)
+    if build_ast_hooks:
+        seconds = time.perf_counter() - start
+        for hook in build_ast_hooks:
+            hook(seconds)
     return ast
 
 
@@ -380,25 +442,125 @@ def print_ast(statements: list[Statement], level=0):
                 print_ast(s.body, level=level+1)
 
 
-def run_ast(ast: list[Statement]):
-    for s in ast:
-        s.run()
+def emit(line: str):
+    global output_offset
+    line += "\n"
+    if checkpointer is not None or output_capture is not None or emit_hooks:
+        size = len(line.encode())
+        output_offset += size
+        if emit_hooks:
+            for hook in emit_hooks:
+                hook(line, size)
+        if output_capture is not None:
+            output_capture.write(line, size)
+    sys.stdout.write(line)
+
+
+def run_ast(ast: list[Statement], start: int = 0):
+    frame = [start]
+    call_stack.append(frame)
+    if metrics is not None:
+        # counted once per block rather than per statement, corrected below
+        # when the block is interrupted by an error or an exit
+        metrics.statements += len(ast) - start
+    try:
+        for i in range(start, len(ast)):
+            frame[0] = i
+            if checkpointer is not None:
+                checkpointer.tick()
+            ast[i].run()
+        call_stack.pop()
+    except BaseException:
+        # the statements following the interrupted one did not run
+        if metrics is not None:
+            metrics.statements -= len(ast) - frame[0] - 1
+        if statements_hooks:
+            for hook in statements_hooks:
+                hook(frame[0] - start + 1)
+        raise
+    if statements_hooks:
+        for hook in statements_hooks:
+            hook(len(ast) - start)
+
+
+def resume_ast(ast: list[Statement], positions: list[int]):
+    # re-enter the nested blocks recorded in positions, then carry on with the
+    # statements following the one that was running in this block
+    start = positions[0]
+    if len(positions) > 1:
+        call_stack.append([start])
+        match ast[start]:
+            case CallFunction():
+                resume_ast(program_functions[ast[start].fun_name], positions[1:])
+            case Condition():
+                resume_ast(ast[start].body, positions[1:])
+        call_stack.pop()
+        start += 1
+    run_ast(ast, start)
 
 
 def run_function(name: str):
-    run_ast(program_functions[name])
+    if metrics is not None:
+        metrics.calls += 1
+    if call_hooks:
+        for hook in call_hooks:
+            hook(name)
+    try:
+        # the cache is used inline, an extra Python frame per call would
+        # lower the recursion depth programs can reach
+        if effect_cache is not None and name in effect_cache.effects and name not in effect_cache.active:
+            key = effect_cache.lookup(name)
+            if key is not None:
+                effect_cache.active.add(name)
+                try:
+                    run_ast(program_functions[name])
+                finally:
+                    effect_cache.active.discard(name)
+                effect_cache.store(key)
+        else:
+            run_ast(program_functions[name])
+    finally:
+        if return_hooks:
+            for hook in return_hooks:
+                hook(name)
 
 
-def print_output_to_stdout():
-    run_function("main")
+HOOKS = {
+    "parse": parse_hooks,  # (seconds) after parsing lines
+    "build_ast": build_ast_hooks,  # (seconds) after building an AST
+    "run": run_hooks,  # (seconds) after a run of main, even on error
+    "call": call_hooks,  # (name) before running a function
+    "return": return_hooks,  # (name) after running a function, even on error
+    "statements": statements_hooks,  # (count) statements run by a block
+    "emit": emit_hooks,  # (line, size in bytes) for every message printed
+}
 
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python3 " + sys.argv[0] + " <filename>")
-        sys.exit(1)
+def add_hook(event: str, callback):
+    HOOKS[event].append(callback)
+
 
-    filename = sys.argv[1]
+def remove_hook(event: str, callback):
+    HOOKS[event].remove(callback)
+
+
+def print_output_to_stdout(positions: list[int] | None = None):
+    # runs main, or resumes it at the positions recorded by a checkpoint
+    if run_hooks:
+        start = time.perf_counter()
+    try:
+        if positions is None:
+            run_function("main")
+        else:
+            resume_ast(program_functions["main"], positions)
+    finally:
+        if run_hooks:
+            seconds = time.perf_counter() - start
+            for hook in run_hooks:
+                hook(seconds)
+
+
+def load_program(filename: str):
     statements = parse(filename)
     fun_dict = extract_functions(statements)
     # print(fun_dict)
@@ -413,7 +575,19 @@ def main():
     global program_functions
     program_functions = ast_dict
 
-    print_output_to_stdout()
+
+def main():
+    if len(sys.argv) == 2 and not sys.argv[1].startswith("-"):
+        load_program(sys.argv[1])
+        print_output_to_stdout()
+        return
+
+    # the options are handled by the features module. Run as a script, this
+    # module is __main__: register it under its name, so that the features
+    # module imports this running instance and not a second copy.
+    sys.modules.setdefault("ASMera", sys.modules[__name__])
+    import ASMera_features
+    ASMera_features.main()
 
 
 if __name__ == "__main__":
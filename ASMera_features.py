@@ -0,0 +1,813 @@
+# optional features of the interpreter: checkpoints, function memoisation,
+# output cache, watch mode and metrics, with the command line parsing. Only
+# imported by ASMera.main when options are given, plain runs never load it.
+from __future__ import annotations
+
+import os
+import sys
+import time
+
+import ASMera
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import argparse
+    from typing import Iterable, Tuple
+
+    from ASMera import Statement
+
+
+class FunctionEffects:
+    def __init__(self):
+        self.reads = set()
+        self.writes = set()
+        self.calls = set()
+        # no output and no declaration, so the body only maps the values of
+        # reads to new values of writes
+        self.cacheable = True
+
+    def __str__(self):
+        return f"FunctionEffects: reads {sorted(self.reads)}, writes {sorted(self.writes)}, calls {sorted(self.calls)}, cacheable {self.cacheable}"
+
+
+def collect_effects(ast: list[Statement], effects: FunctionEffects):
+    for s in ast:
+        match s:
+            case ASMera.Increment():
+                effects.reads.add(s.var)
+                effects.writes.add(s.var)
+            case ASMera.DeclareVar():
+                effects.writes.add(s.name)
+                effects.cacheable = False
+            case ASMera.Condition():
+                for operand in (s.left, s.right):
+                    if isinstance(operand, ASMera.VarRef):
+                        effects.reads.add(operand.var_name)
+                collect_effects(s.body, effects)
+            case ASMera.CallFunction():
+                effects.calls.add(s.fun_name)
+            case ASMera.Message():
+                effects.cacheable = False
+
+
+def analyse_effects(functions: dict[list[Statement]]) -> dict[FunctionEffects]:
+    effects = dict()
+    for name, ast in functions.items():
+        effects[name] = FunctionEffects()
+        collect_effects(ast, effects[name])
+
+    # propagate the effects of callees until nothing changes (calls can be
+    # recursive)
+    changed = True
+    while changed:
+        changed = False
+        for e in effects.values():
+            for callee in e.calls:
+                if callee not in effects:
+                    changed |= e.cacheable
+                    e.cacheable = False
+                    continue
+                c = effects[callee]
+                before = (len(e.reads), len(e.writes), e.cacheable)
+                e.reads |= c.reads
+                e.writes |= c.writes
+                e.cacheable &= c.cacheable
+                changed |= before != (len(e.reads), len(e.writes), e.cacheable)
+    return effects
+
+
+class EffectCache:
+    def __init__(self, effects: dict[FunctionEffects], max_size: int):
+        # sorted read and write sets of the cacheable functions only
+        from collections import OrderedDict
+        self.effects = {name: (tuple(sorted(e.reads)), tuple(sorted(e.writes)))
+                        for name, e in effects.items() if e.cacheable}
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        # functions being run with the cache, not cached again until they
+        # return: every level of a recursive loop reads different values
+        self.active = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return f"EffectCache: {self.hits} hits, {self.misses} misses, {len(self.entries)} entries"
+
+    def lookup(self, name: str) -> tuple | None:
+        # applies the cached effects of the call and returns None on a hit,
+        # otherwise the key to store the effects of the run under
+        (reads, writes) = self.effects[name]
+        key = (name, tuple(ASMera.program_vars.get(v) for v in reads))
+        delta = self.entries.get(key)
+        if delta is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            ASMera.program_vars.update(delta)
+            return None
+        self.misses += 1
+        return key
+
+    def store(self, key: tuple):
+        (reads, writes) = self.effects[key[0]]
+        self.entries[key] = tuple((v, ASMera.program_vars[v])
+                                  for v in writes if v in ASMera.program_vars)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+def current_functions() -> list[str]:
+    # names of the functions being run, from the positions in call_stack
+    names = ["main"]
+    block = ASMera.program_functions["main"]
+    for frame in ASMera.call_stack[:-1]:
+        s = block[frame[0]]
+        match s:
+            case ASMera.CallFunction():
+                names.append(s.fun_name)
+                block = ASMera.program_functions[s.fun_name]
+            case ASMera.Condition():
+                block = s.body
+    return names
+
+
+class Metrics:
+    def __init__(self):
+        self.statements = 0
+        # calls of run_function, including the one of main
+        self.calls = 0
+        # deepest call stack seen by the sampler: tracking the depth on every
+        # call would cost more than all the counters together
+        self.max_depth = 0
+        self.messages = 0
+        self.bytes_emitted = 0
+        # phase -> seconds
+        self.timings = dict()
+        # "main;f;g" -> number of samples taken while running g
+        self.samples = dict()
+
+    def add_time(self, phase: str, seconds: float):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def install(self):
+        # calls and statements are counted directly by run_function and
+        # run_ast, being too frequent for hooks
+        ASMera.metrics = self
+        ASMera.add_hook("parse", lambda seconds: self.add_time("parse", seconds))
+        ASMera.add_hook("build_ast", lambda seconds: self.add_time("build_ast", seconds))
+        ASMera.add_hook("run", lambda seconds: self.add_time("run", seconds))
+        ASMera.add_hook("emit", self.count_message)
+
+    def count_message(self, line: str, size: int):
+        self.messages += 1
+        self.bytes_emitted += size
+
+    def sample(self, signum, frame):
+        if len(ASMera.call_stack) == 0:
+            return
+        try:
+            names = current_functions()
+        except (IndexError, KeyError):
+            # call_stack was being updated when the signal arrived
+            return
+        self.max_depth = max(self.max_depth, len(names))
+        # loops are written as recursive calls, keep one frame for them
+        folded = [name for (i, name) in enumerate(names) if i == 0 or names[i - 1] != name]
+        stack = ";".join(folded)
+        self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def start_sampler(self, interval: float):
+        import signal
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+
+    def stop_sampler(self):
+        import signal
+        signal.setitimer(signal.ITIMER_PROF, 0)
+
+    def to_dict(self) -> dict:
+        return {
+            "statements": self.statements,
+            "calls": self.calls,
+            "max_call_depth": self.max_depth,
+            "messages": self.messages,
+            "bytes_emitted": self.bytes_emitted,
+            "phase_seconds": self.timings,
+            "samples": self.samples,
+        }
+
+    def to_prometheus(self) -> str:
+        lines = list()
+
+        def metric(name: str, kind: str, help: str, values: list[Tuple[str, float]]):
+            lines.append(f"# HELP asmera_{name} {help}")
+            lines.append(f"# TYPE asmera_{name} {kind}")
+            for (labels, value) in values:
+                lines.append(f"asmera_{name}{labels} {value}")
+
+        metric("statements_total", "counter", "Statements executed.", [("", self.statements)])
+        metric("calls_total", "counter", "Function runs, including main.", [("", self.calls)])
+        metric("max_call_depth", "gauge", "Maximum function call depth seen by the sampler.", [("", self.max_depth)])
+        metric("messages_total", "counter", "Messages printed.", [("", self.messages)])
+        metric("emitted_bytes_total", "counter", "Bytes written to stdout.", [("", self.bytes_emitted)])
+        metric("phase_seconds", "gauge", "Time spent in each phase.",
+               [(f'{{phase="{phase}"}}', seconds) for phase, seconds in sorted(self.timings.items())])
+        if len(self.samples) > 0:
+            # samples of the innermost function only, full stacks are in JSON
+            leaves = dict()
+            for stack, count in self.samples.items():
+                leaf = stack.rpartition(";")[2]
+                leaves[leaf] = leaves.get(leaf, 0) + count
+            metric("function_samples_total", "counter", "Stack samples per running function.",
+                   [(f'{{function="{name}"}}', count) for name, count in sorted(leaves.items())])
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str, format: str):
+        import json
+        self.stop_sampler()
+        if format == "json":
+            content = json.dumps(self.to_dict(), indent=2) + "\n"
+        else:
+            content = self.to_prometheus()
+        # replace atomically, for collectors reading the file at any time
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+CHECKPOINT_MAGIC = b"ASMCKPT"
+CHECKPOINT_VERSION = 2
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def source_hash(filename: str) -> str:
+    import hashlib
+    with open(filename, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def stdout_file() -> dict | None:
+    # identity, position and size of stdout when it is a regular file, after
+    # flushing so that they match what is actually on disk
+    import fcntl
+    import stat
+    sys.stdout.flush()
+    try:
+        fd = sys.stdout.fileno()
+        st = os.fstat(fd)
+    except (OSError, ValueError):
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    append = fcntl.fcntl(fd, fcntl.F_GETFL) & os.O_APPEND != 0
+    position = st.st_size if append else os.lseek(fd, 0, os.SEEK_CUR)
+    return {"dev": st.st_dev, "ino": st.st_ino, "position": position,
+            "size": st.st_size, "append": append}
+
+
+def write_checkpoint(path: str, source: str, stdout_start: int | None):
+    import json
+    import zlib
+    state = {
+        "source": source,
+        "vars": ASMera.program_vars,
+        "stack": [frame[0] for frame in ASMera.call_stack],
+        # reporting only, this is not a position in the stdout file
+        "output_offset": ASMera.output_offset,
+        "stdout": stdout_file(),
+        "stdout_start": stdout_start,
+    }
+    payload = zlib.compress(json.dumps(state, separators=(",", ":")).encode())
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CHECKPOINT_MAGIC + bytes([CHECKPOINT_VERSION]) + payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_checkpoint(path: str, source: str) -> dict:
+    import json
+    import zlib
+    with open(path, "rb") as f:
+        data = f.read()
+    header_len = len(CHECKPOINT_MAGIC) + 1
+    if data[:len(CHECKPOINT_MAGIC)] != CHECKPOINT_MAGIC:
+        raise CheckpointError(f"{path} is not a checkpoint file")
+    version = data[len(CHECKPOINT_MAGIC)]
+    if version != CHECKPOINT_VERSION:
+        raise CheckpointError(f"unsupported checkpoint version {version}")
+    state = json.loads(zlib.decompress(data[header_len:]))
+    if state["source"] != source:
+        raise CheckpointError("checkpoint was taken from a different source file")
+    return state
+
+
+class Checkpointer:
+    def __init__(self, path: str, source: str, every: int, stdout_start: int | None):
+        self.path = path
+        self.source = source
+        self.every = every
+        # position of stdout when the first run started, which output
+        # truncation on resume never goes below
+        self.stdout_start = stdout_start
+        self.countdown = every
+        self.stop_requested = False
+
+    def request_stop(self, signum, frame):
+        # only snapshot at a statement boundary
+        self.stop_requested = True
+
+    def tick(self):
+        if self.stop_requested:
+            import signal
+            write_checkpoint(self.path, self.source, self.stdout_start)
+            sys.exit(128 + signal.SIGTERM)
+        if self.every > 0:
+            self.countdown -= 1
+            if self.countdown == 0:
+                self.countdown = self.every
+                write_checkpoint(self.path, self.source, self.stdout_start)
+
+
+def rewind_stdout(state: dict):
+    # drop output emitted after the snapshot when stdout is the same regular
+    # file (e.g. opened with >>), so that it is not duplicated on resume
+    saved = state["stdout"]
+    current = stdout_file()
+    if saved is None or current is None:
+        return
+    if (current["dev"], current["ino"]) != (saved["dev"], saved["ino"]):
+        return
+    position = saved["position"]
+    if state["stdout_start"] is not None:
+        position = max(position, state["stdout_start"])
+    if current["size"] > position:
+        fd = sys.stdout.fileno()
+        os.ftruncate(fd, position)
+        if not current["append"]:
+            os.lseek(fd, position, os.SEEK_SET)
+
+
+def resume_from_checkpoint(state: dict):
+    ASMera.program_vars = state["vars"]
+    ASMera.output_offset = state["output_offset"]
+    rewind_stdout(state)
+    ASMera.print_output_to_stdout(state["stack"])
+
+
+def default_cache_dir() -> str:
+    if "ASMERA_CACHE_DIR" in os.environ:
+        return os.environ["ASMERA_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base, "asmera")
+
+
+def interpreter_hash() -> str:
+    # hash of the code of both interpreter modules, so that any change invalidates
+    # the cached outputs without relying on a __version__ bump. get_data also
+    # reads the bytecode when running from the zipapp.
+    import hashlib
+    h = hashlib.sha256()
+    for module in (ASMera, sys.modules[__name__]):
+        h.update(module.__loader__.get_data(module.__file__))
+    return h.hexdigest()
+
+
+def output_cache_key(filename: str, overrides: dict[int]) -> str:
+    import hashlib
+    import json
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        h.update(f.read())
+    h.update(b"\0" + interpreter_hash().encode() + b"\0")
+    h.update(json.dumps(sorted(overrides.items())).encode())
+    # the stored bytes are those of the stdout encoding
+    h.update(f"\0{sys.stdout.encoding}\0{sys.stdout.errors}".encode())
+    return h.hexdigest()
+
+
+class OutputCapture:
+    # streams the output of a run to a temporary file of the cache, given up
+    # once it outgrows the cache
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        # encoded like stdout, replaying the bytes must print the same
+        self.file = open(path, "w", encoding=sys.stdout.encoding,
+                         errors=sys.stdout.errors, newline="")
+
+    def write(self, line: str, size: int):
+        if self.file is None:
+            return
+        self.size += size
+        if self.size > self.max_bytes:
+            self.discard()
+            return
+        self.file.write(line)
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            os.remove(self.path)
+
+
+class OutputCache:
+    # each entry is <key>.out holding the raw stdout bytes, and <key>.json
+    # describing it. The mtime of the .out file is the last use, for LRU.
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def output_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".out")
+
+    def meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def replay(self, key: str) -> bool:
+        import mmap
+        path = self.output_path(key)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return False
+        with f:
+            os.utime(path)
+            sys.stdout.flush()
+            if os.fstat(f.fileno()).st_size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    sys.stdout.buffer.write(m)
+            sys.stdout.buffer.flush()
+        return True
+
+    def start_capture(self, key: str) -> OutputCapture:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.output_path(key)}.{os.getpid()}.tmp"
+        return OutputCapture(tmp_path, self.max_bytes)
+
+    def store(self, key: str, capture: OutputCapture, filename: str, overrides: dict[int]):
+        import json
+        if capture.file is None:
+            # the output did not fit in the cache
+            return
+        capture.file.close()
+        capture.file = None
+        meta = {
+            "source": os.path.abspath(filename),
+            "version": ASMera.__version__,
+            "interpreter": interpreter_hash()[:16],
+            "overrides": overrides,
+            "encoding": sys.stdout.encoding,
+            "size": os.stat(capture.path).st_size,
+            "created": time.time(),
+        }
+        # write the metadata first so that every visible output has one
+        meta_tmp_path = self.meta_path(key) + ".tmp"
+        with open(meta_tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_tmp_path, self.meta_path(key))
+        os.replace(capture.path, self.output_path(key))
+        self.prune()
+
+    def sizes(self) -> list[tuple[float, int, str]]:
+        # (last use, bytes, key) of every entry, least recently used first,
+        # from the directory listing and stat only
+        stats = dict()
+        try:
+            scan = os.scandir(self.directory)
+        except FileNotFoundError:
+            return list()
+        with scan:
+            for entry in scan:
+                if entry.name.endswith((".out", ".json")):
+                    try:
+                        stats[entry.name] = entry.stat()
+                    except OSError:
+                        pass
+        sizes = list()
+        for name, st in stats.items():
+            if name.endswith(".out"):
+                key = name[:-len(".out")]
+                meta = stats.get(key + ".json")
+                size = st.st_size + (0 if meta is None else meta.st_size)
+                sizes.append((st.st_mtime, size, key))
+        sizes.sort()
+        return sizes
+
+    def entries(self) -> list[dict]:
+        import json
+        entries = list()
+        for (last_used, size, key) in self.sizes():
+            try:
+                with open(self.meta_path(key)) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = dict()
+            meta["key"] = key
+            meta["last_used"] = last_used
+            meta["bytes"] = size
+            entries.append(meta)
+        return entries
+
+    def remove(self, key: str):
+        for path in (self.output_path(key), self.meta_path(key)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def prune(self, max_bytes: int | None = None) -> int:
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        sizes = self.sizes()
+        total = sum(size for (_, size, _) in sizes)
+        removed = 0
+        for (_, size, key) in sizes:
+            if total <= max_bytes:
+                break
+            self.remove(key)
+            total -= size
+            removed += 1
+        return removed
+
+    def print_entries(self):
+        entries = self.entries()
+        for e in reversed(entries):
+            last_used = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(e["last_used"]))
+            overrides = " ".join(f"{k}={v}" for k, v in sorted(e.get("overrides", dict()).items()))
+            print(f"{e['key'][:16]}  {e['bytes']:>10}  {last_used}  {e.get('version', '?')}+{e.get('interpreter', '?')}  {e.get('source', '?')}  {overrides}")
+        total = sum(e["bytes"] for e in entries)
+        print(f"{len(entries)} entries, {total} bytes in {self.directory} (cap {self.max_bytes})")
+
+
+def parse_override(text: str) -> tuple[str, int]:
+    import argparse
+    (name, sep, value) = text.partition("=")
+    if sep == "" or len(name) == 0:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text!r}")
+    try:
+        return (name, int(value))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not an integer")
+
+
+def parse_args() -> argparse.Namespace:
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="python3 " + sys.argv[0], description="ASMera interpreter")
+    parser.add_argument("filename", nargs="?")
+    parser.add_argument("--version", action="version", version=ASMera.__version__)
+    parser.add_argument("--set", metavar="NAME=VALUE", dest="overrides",
+                        type=parse_override, action="append", default=list(),
+                        help="override the initial value of a nombre declaration")
+    parser.add_argument("--checkpoint", metavar="PATH",
+                        help="snapshot the interpreter state to PATH on SIGTERM")
+    parser.add_argument("--checkpoint-every", metavar="N", type=int, default=0,
+                        help="also snapshot every N executed statements")
+    parser.add_argument("--resume", action="store_true",
+                        help="resume execution from the --checkpoint snapshot")
+    parser.add_argument("--memo", action="store_true",
+                        help="cache the effects of functions without output")
+    parser.add_argument("--memo-size", metavar="N", type=int, default=4096,
+                        help="maximum number of cached function effects")
+    parser.add_argument("--memo-stats", action="store_true",
+                        help="print effect cache hits and misses to stderr")
+    parser.add_argument("--cache-output", action="store_true",
+                        help="replay the stored output of an identical previous run")
+    parser.add_argument("--cache-dir", metavar="DIR", default=default_cache_dir(),
+                        help="output cache directory (default: %(default)s)")
+    parser.add_argument("--cache-max-bytes", metavar="N", type=int, default=256 * 1024 * 1024,
+                        help="output cache size cap, least recently used entries are evicted first")
+    parser.add_argument("--cache-list", action="store_true",
+                        help="list the output cache entries and exit")
+    parser.add_argument("--cache-prune", action="store_true",
+                        help="evict entries until the cache fits --cache-max-bytes and exit")
+    parser.add_argument("--cache-clear", action="store_true",
+                        help="remove every output cache entry and exit")
+    parser.add_argument("--watch", action="store_true",
+                        help="re-run on every change of the file, reparsing only the changed functions")
+    parser.add_argument("--watch-interval", metavar="SECONDS", type=float, default=0.2,
+                        help="polling interval of --watch")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write execution metrics to PATH at exit")
+    parser.add_argument("--metrics-format", choices=["prometheus", "json"],
+                        help="format of --metrics (default: json for a .json PATH, prometheus otherwise)")
+    parser.add_argument("--sample-interval", metavar="SECONDS", type=float, default=0.005,
+                        help="CPU time interval of the --metrics sampler of the running functions and "
+                             "call depth, 0 disables it (default: %(default)s)")
+    args = parser.parse_args()
+    if args.metrics_format is None and args.metrics is not None:
+        args.metrics_format = "json" if args.metrics.endswith(".json") else "prometheus"
+    args.cache_command = args.cache_list or args.cache_prune or args.cache_clear
+    if args.filename is None and not args.cache_command:
+        parser.error("the following arguments are required: filename")
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume requires --checkpoint")
+    if args.watch and (args.checkpoint is not None or args.cache_output):
+        parser.error("--watch cannot be combined with --checkpoint or --cache-output")
+    return args
+
+
+def run_with_checkpoint(args: argparse.Namespace, filename: str):
+    import signal
+
+    source = source_hash(filename)
+    state = None
+    if args.resume:
+        try:
+            state = read_checkpoint(args.checkpoint, source)
+        except (OSError, CheckpointError) as e:
+            print(f"Cannot resume: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    if state is None:
+        current = stdout_file()
+        stdout_start = None if current is None else current["position"]
+    else:
+        stdout_start = state["stdout_start"]
+    ASMera.checkpointer = Checkpointer(args.checkpoint, source, args.checkpoint_every, stdout_start)
+    signal.signal(signal.SIGTERM, ASMera.checkpointer.request_stop)
+    if state is None:
+        ASMera.print_output_to_stdout()
+    else:
+        resume_from_checkpoint(state)
+    ASMera.checkpointer = None
+
+    # the run completed, the snapshot is stale
+    sys.stdout.flush()
+    if os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+
+def run_cache_command(args: argparse.Namespace):
+    cache = OutputCache(args.cache_dir, args.cache_max_bytes)
+    if args.cache_clear:
+        removed = cache.prune(0)
+        print(f"removed {removed} entries")
+    elif args.cache_prune:
+        removed = cache.prune()
+        print(f"removed {removed} entries")
+    if args.cache_list:
+        cache.print_entries()
+
+
+KEYWORDS = {'message', 'nombre', 'appel', 'retour', 'si', 'incrementer', 'finsi'}
+
+
+def split_functions(lines: Iterable[str]) -> dict[list[str]]:
+    # same split as ASMera.extract_functions, but on the source lines, without
+    # parsing them
+    current_fun_name = "main"
+    chunks = dict()
+    for line in lines:
+        line = line.rstrip()
+        if len(line) == 0 or line[0] == ';':
+            continue
+        first = line.partition(' ')[0]
+        if first == 'retour':
+            current_fun_name = "main"
+        elif first not in KEYWORDS and first[-1:] == ':':
+            current_fun_name = first[:-1]
+        elif current_fun_name in chunks:
+            chunks[current_fun_name].append(line)
+        else:
+            chunks[current_fun_name] = [line]
+    return chunks
+
+
+class Watcher:
+    def __init__(self, filename: str, memo_size: int | None):
+        self.filename = filename
+        self.memo_size = memo_size
+        # source lines of the functions currently in program_functions
+        self.chunks = dict()
+        self.signature = None
+
+    def source_changed(self) -> bool:
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            return False
+        signature = (st.st_mtime_ns, st.st_size)
+        if self.signature == signature:
+            return False
+        self.signature = signature
+        return True
+
+    def reload(self) -> Tuple[int, int]:
+        with open(self.filename) as f:
+            chunks = split_functions(f)
+        changed = [name for name, lines in chunks.items()
+                   if self.chunks.get(name) != lines]
+        # parse everything first, so that a syntax error leaves the previous
+        # version in place
+        asts = {name: ASMera.build_ast(ASMera.parse_lines(chunks[name])) for name in changed}
+        for name in self.chunks.keys() - chunks.keys():
+            del ASMera.program_functions[name]
+        ASMera.program_functions.update(asts)
+        self.chunks = chunks
+        return (len(changed), len(chunks))
+
+    def run(self):
+        ASMera.program_vars.clear()
+        ASMera.call_stack.clear()
+        ASMera.output_offset = 0
+        if self.memo_size is not None:
+            ASMera.effect_cache = EffectCache(analyse_effects(ASMera.program_functions), self.memo_size)
+        ASMera.print_output_to_stdout()
+
+    def step(self):
+        start = time.perf_counter()
+        try:
+            (reparsed, total) = self.reload()
+        except (Exception, SystemExit) as e:
+            print(f"[watch] parse failed: {e!r}", file=sys.stderr)
+            return
+        parse_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            self.run()
+        except (Exception, SystemExit) as e:
+            sys.stdout.flush()
+            print(f"[watch] run failed: {e!r}", file=sys.stderr)
+        run_time = time.perf_counter() - start
+        sys.stdout.flush()
+        print(f"[watch] parse: {parse_time * 1000:.2f} ms ({reparsed}/{total} functions reparsed), "
+              f"run: {run_time * 1000:.2f} ms", file=sys.stderr)
+
+    def watch(self, interval: float):
+        try:
+            while True:
+                if self.source_changed():
+                    self.step()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+
+def main():
+    args = parse_args()
+
+    if args.cache_command:
+        run_cache_command(args)
+        return
+
+    filename = args.filename
+    overrides = dict(args.overrides)
+
+    if args.metrics is not None:
+        import atexit
+        Metrics().install()
+        atexit.register(ASMera.metrics.export, args.metrics, args.metrics_format)
+        if args.sample_interval > 0:
+            ASMera.metrics.start_sampler(args.sample_interval)
+
+    if args.watch:
+        ASMera.initial_values.update(overrides)
+        watcher = Watcher(filename, args.memo_size if args.memo else None)
+        watcher.watch(args.watch_interval)
+        return
+
+    cache = None
+    if args.cache_output:
+        cache = OutputCache(args.cache_dir, args.cache_max_bytes)
+        key = output_cache_key(filename, overrides)
+        if cache.replay(key):
+            return
+        # a resumed run only produces the end of the output
+        if args.resume:
+            cache = None
+
+    ASMera.load_program(filename)
+    ASMera.initial_values.update(overrides)
+
+    if args.memo:
+        ASMera.effect_cache = EffectCache(analyse_effects(ASMera.program_functions), args.memo_size)
+
+    if cache is not None:
+        ASMera.output_capture = cache.start_capture(key)
+
+    try:
+        if args.checkpoint is None:
+            ASMera.print_output_to_stdout()
+        else:
+            run_with_checkpoint(args, filename)
+    except BaseException:
+        # only complete runs are stored
+        if ASMera.output_capture is not None:
+            ASMera.output_capture.discard()
+        raise
+
+    if cache is not None:
+        cache.store(key, ASMera.output_capture, filename, overrides)
+        ASMera.output_capture = None
+
+    if args.memo_stats and ASMera.effect_cache is not None:
+        sys.stdout.flush()
+        print(ASMera.effect_cache, file=sys.stderr)
+
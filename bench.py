@@ -0,0 +1,67 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import build_zipapp
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TINY_PROGRAM = 'nombre x 1\nmessage "x =" $x\n'
+
+
+def measure(command: list[str], runs: int) -> list[float]:
+    timings = list()
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def startup_commands(program: str, pyz: str) -> list[tuple[str, list[str]]]:
+    python = sys.executable
+    return [
+        ("python3 -c pass", [python, "-c", "pass"]),
+        ("ASMera.py", [python, os.path.join(HERE, "ASMera.py"), program]),
+        ("ASMera.py with options", [python, os.path.join(HERE, "ASMera.py"), "--memo", program]),
+        ("ASMera_notype.py", [python, os.path.join(HERE, "ASMera_notype.py"), program]),
+        ("asmera.pyz", [python, pyz, program]),
+    ]
+
+
+def bench_startup(runs: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        program = os.path.join(tmp, "tiny.asm")
+        with open(program, "w") as f:
+            f.write(TINY_PROGRAM)
+        pyz = os.path.join(tmp, "asmera.pyz")
+        build_zipapp.build(pyz)
+
+        print(f"startup, {runs} runs of a two-line program")
+        print(f"{'':24} {'median':>9} {'min':>9} {'vs pass':>9}")
+        baseline = None
+        for (name, command) in startup_commands(program, pyz):
+            # warm up the OS caches and __pycache__
+            measure(command, 1)
+            timings = measure(command, runs)
+            median = statistics.median(timings) * 1000
+            if baseline is None:
+                baseline = median
+            print(f"{name:24} {median:7.1f}ms {min(timings) * 1000:7.1f}ms {median - baseline:+7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASMera benchmarks")
+    parser.add_argument("--runs", metavar="N", type=int, default=30,
+                        help="number of runs of every measurement")
+    args = parser.parse_args()
+
+    bench_startup(args.runs)
+
+
+if __name__ == "__main__":
+    main()
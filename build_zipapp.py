@@ -0,0 +1,51 @@
+import argparse
+import importlib.util
+import marshal
+import os
+import sys
+import zipfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MODULES = ["ASMera", "ASMera_features"]
+MAIN = "import ASMera\nASMera.main()\n"
+
+
+def pyc(source: str, filename: str) -> bytes:
+    # sourceless bytecode: the interpreter loads it without looking for, or
+    # compiling, the .py file. Only valid for the Python version building it.
+    code = compile(source, filename, "exec", dont_inherit=True)
+    # header: magic, flags, then source mtime and size, unused without source
+    return importlib.util.MAGIC_NUMBER + bytes(4) + bytes(8) + marshal.dumps(code)
+
+
+def build(target: str, interpreter: str = "/usr/bin/env python3"):
+    tmp_target = target + ".tmp"
+    with open(tmp_target, "wb") as f:
+        f.write(b"#!" + interpreter.encode() + b"\n")
+        # stored rather than deflated, so that zipimport does not need zlib
+        with zipfile.ZipFile(f, "w", compression=zipfile.ZIP_STORED) as z:
+            for module in MODULES:
+                with open(os.path.join(HERE, module + ".py")) as m:
+                    z.writestr(module + ".pyc", pyc(m.read(), module + ".py"))
+            z.writestr("__main__.pyc", pyc(MAIN, "__main__.py"))
+    os.chmod(tmp_target, 0o755)
+    os.replace(tmp_target, target)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build a single-file precompiled ASMera executable")
+    parser.add_argument("--output", "-o", metavar="PATH", default=os.path.join(HERE, "dist", "asmera.pyz"),
+                        help="archive to create (default: %(default)s)")
+    parser.add_argument("--python", metavar="INTERPRETER", default="/usr/bin/env python3",
+                        help="interpreter of the shebang line, must be the running Python version")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    build(args.output, args.python)
+    print(f"built {args.output} for Python {sys.version_info.major}.{sys.version_info.minor}")
+
+
+if __name__ == "__main__":
+    main()
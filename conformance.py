@@ -0,0 +1,356 @@
+import argparse
+import os
+import random
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# name -> command line, the program file is appended. The first engine is the
+# reference the others are compared to.
+ENGINES = {
+    "ASMera.py": [sys.executable, os.path.join(HERE, "ASMera.py")],
+    "ASMera_notype.py": [sys.executable, os.path.join(HERE, "ASMera_notype.py")],
+    "ASMera.py --memo": [sys.executable, os.path.join(HERE, "ASMera.py"), "--memo"],
+    "ASMera.py resumed": [sys.executable, os.path.abspath(__file__), "--run-resumed"],
+}
+
+KEYWORDS = {'message', 'nombre', 'appel', 'retour', 'si', 'incrementer', 'finsi'}
+COMPARISONS = ['==', '!=', '<', '<=', '>', '>=']
+WORDS = ['a', 'b', 'x=', 'total:', 'fin', 'ok', '-', '42', 'si', 'appel', 'x,y']
+
+
+class ProgramGenerator:
+    def __init__(self, rng: random.Random, max_vars: int = 4, max_functions: int = 4,
+                 max_statements: int = 6, max_depth: int = 3):
+        self.rng = rng
+        self.max_vars = max_vars
+        self.max_functions = max_functions
+        self.max_statements = max_statements
+        self.max_depth = max_depth
+
+    def operand(self) -> str:
+        if self.rng.random() < 0.7:
+            return "$" + self.rng.choice(self.vars)
+        return str(self.rng.randint(-3, 6))
+
+    def message_element(self) -> str:
+        r = self.rng.random()
+        if r < 0.35:
+            return "$" + self.rng.choice(self.vars)
+        elif r < 0.7:
+            words = self.rng.sample(WORDS + [''], self.rng.randint(1, 3))
+            return "\"" + " ".join(words) + "\""
+        else:
+            return self.rng.choice(WORDS)
+
+    def message(self) -> str:
+        elements = [self.message_element() for _ in range(self.rng.randint(0, 5))]
+        return " ".join(["message"] + elements)
+
+    def block(self, fun_index: int, depth: int) -> list[str]:
+        lines = list()
+        for _ in range(self.rng.randint(1, self.max_statements)):
+            r = self.rng.random()
+            callees = self.functions[fun_index + 1:]
+            if r < 0.3 and fun_index not in self.silent:
+                lines.append(self.message())
+            elif r < 0.55:
+                step = self.rng.choice([-2, -1, 1, 1, 2, 5])
+                lines.append(f"incrementer {self.rng.choice(self.vars)} {step}")
+            elif r < 0.75 and depth < self.max_depth:
+                op = self.rng.choice(COMPARISONS)
+                left = self.operand()
+                # equal operands are the edge case of every comparison
+                right = left if self.rng.random() < 0.25 else self.operand()
+                lines.append(f"si {left} {op} {right}")
+                lines.extend(self.block(fun_index, depth + 1))
+                lines.append("finsi")
+            elif r < 0.8 and fun_index > 0 and depth < self.max_depth:
+                lines.extend(self.self_call(fun_index))
+            elif r < 0.9 and len(callees) > 0:
+                # other functions are only called when declared later, so
+                # that every program terminates
+                lines.append("appel " + self.rng.choice(callees))
+            elif r < 0.95:
+                lines.append("; comment")
+            else:
+                lines.append("")
+        return lines
+
+    def self_call(self, fun_index: int) -> list[str]:
+        # recursion is the only loop of the language, bounded by a counter
+        # of the function. Decrementing it after the call makes every
+        # activation loop again, and repeats states for --memo.
+        counter = "n" + self.functions[fun_index]
+        self.counters[counter] = None
+        lines = [f"si ${counter} < {self.rng.randint(1, 5)}",
+                 f"incrementer {counter} 1",
+                 "appel " + self.functions[fun_index]]
+        if self.rng.random() < 0.5:
+            lines.append(f"incrementer {counter} -1")
+        lines.append("finsi")
+        return lines
+
+    def generate(self) -> list[str]:
+        self.vars = [f"v{i}" for i in range(self.rng.randint(1, self.max_vars))]
+        # main is index 0
+        self.functions = ["main"] + [f"f{i}" for i in range(self.rng.randint(0, self.max_functions))]
+        # counters of the recursive functions, in order of appearance
+        self.counters = dict()
+        # functions without messages, the ones --memo caches
+        self.silent = {i for i in range(1, len(self.functions)) if self.rng.random() < 0.4}
+
+        main = self.block(0, 0)
+        # reach most functions, repeated calls being the ones --memo can hit
+        for name in self.functions[1:]:
+            main.extend(["appel " + name] * self.rng.randint(0, 2))
+        functions = list()
+        for (i, name) in enumerate(self.functions[1:], start=1):
+            functions.append("")
+            functions.append(name + ":")
+            functions.extend(self.block(i, 0))
+            functions.append("retour")
+
+        observed = self.vars + list(self.counters)
+        lines = [f"nombre {v} {self.rng.randint(-3, 3)}" for v in self.vars]
+        lines.extend(f"nombre {c} 0" for c in self.counters)
+        lines.extend(main)
+        # make the final state observable, labelled as consecutive values are
+        # printed without a separator
+        lines.append(" ".join(["message"] + [f"{v}= ${v}" for v in observed]))
+        lines.extend(functions)
+        return lines
+
+
+ERROR = "<error>\n"
+TIMEOUT = "<timeout>\n"
+
+
+def run_engines(engines: dict[list[str]], lines: list[str], timeout: float) -> dict[str]:
+    with tempfile.NamedTemporaryFile("w", suffix=".asm", delete=False) as f:
+        f.write("\n".join(lines) + "\n")
+    try:
+        # start every engine before waiting for any of them
+        processes = {name: subprocess.Popen(command + [f.name], stdout=subprocess.PIPE,
+                                            stderr=subprocess.DEVNULL, text=True)
+                     for name, command in engines.items()}
+        outputs = dict()
+        for name, p in processes.items():
+            try:
+                (stdout, _) = p.communicate(timeout=timeout)
+                # failures are compared too, but not their tracebacks
+                outputs[name] = stdout + ("" if p.returncode == 0 else ERROR)
+            except subprocess.TimeoutExpired:
+                p.kill()
+                p.communicate()
+                outputs[name] = TIMEOUT
+        return outputs
+    finally:
+        os.remove(f.name)
+
+
+def diverging(outputs: dict[str]) -> bool:
+    return len(set(outputs.values())) > 1
+
+
+def failure_test(engines: dict[list[str]], outputs: dict[str], timeout: float):
+    # a reduced program still fails when the engines disagree, and when the
+    # reference engine accepts it if it accepted the original one
+    reference = next(iter(engines))
+    reference_ok = not outputs[reference].endswith((ERROR, TIMEOUT))
+    results = dict()
+
+    def is_failing(lines: list[str]) -> bool:
+        key = tuple(lines)
+        if key not in results:
+            outputs = run_engines(engines, lines, timeout)
+            results[key] = diverging(outputs) and (
+                not reference_ok or not outputs[reference].endswith((ERROR, TIMEOUT)))
+        return results[key]
+
+    return is_failing
+
+
+def first_word(line: str) -> str:
+    return line.partition(' ')[0]
+
+
+def reductions(lines: list[str]):
+    # smaller programs that keep the syntax valid: whole functions with their
+    # call sites, then whole si/finsi blocks, largest first, then the same
+    # blocks with their body kept
+    for (i, line) in enumerate(lines):
+        name = first_word(line)
+        if name in KEYWORDS or name[-1:] != ':':
+            continue
+        end = i + 1
+        while end < len(lines) and first_word(lines[end]) != 'retour':
+            end += 1
+        call = "appel " + name[:-1]
+        yield [l for l in lines[:i] + lines[end + 1:] if l.strip() != call]
+
+    blocks = list()
+    open_blocks = list()
+    for (i, line) in enumerate(lines):
+        if first_word(line) == 'si':
+            open_blocks.append(i)
+        elif first_word(line) == 'finsi' and len(open_blocks) > 0:
+            blocks.append((open_blocks.pop(), i))
+    blocks.sort(key=lambda b: b[0] - b[1])
+    for (start, end) in blocks:
+        yield lines[:start] + lines[end + 1:]
+    for (start, end) in blocks:
+        yield lines[:start] + lines[start + 1:end] + lines[end + 1:]
+
+
+def minimise_structure(lines: list[str], is_failing) -> list[str]:
+    progress = True
+    while progress:
+        progress = False
+        for candidate in reductions(lines):
+            if is_failing(candidate):
+                lines = candidate
+                progress = True
+                break
+    return lines
+
+
+def minimise_lines(lines: list[str], is_failing) -> list[str]:
+    # delta debugging on lines: remove chunks as long as the failure remains,
+    # with chunks getting smaller when no removal works
+    n = 2
+    while len(lines) >= 2:
+        chunk = (len(lines) + n - 1) // n
+        for start in range(0, len(lines), chunk):
+            candidate = lines[:start] + lines[start + chunk:]
+            if is_failing(candidate):
+                lines = candidate
+                n = max(n - 1, 2)
+                break
+        else:
+            if n >= len(lines):
+                break
+            n = min(2 * n, len(lines))
+    return lines
+
+
+def minimise(lines: list[str], is_failing) -> list[str]:
+    # syntax-aware reductions first, single lines for what they cannot remove
+    while True:
+        reduced = minimise_lines(minimise_structure(lines, is_failing), is_failing)
+        if reduced == lines:
+            return lines
+        lines = reduced
+
+
+def run_resumed(filename: str) -> int:
+    # engine checking checkpoint and resume: the run is killed after its first
+    # snapshot and message, then resumed on the same output file, which must end up
+    # holding the output of an uninterrupted run
+    asmera = [sys.executable, os.path.join(HERE, "ASMera.py")]
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, "state")
+        output = os.path.join(tmp, "stdout")
+        with open(output, "wb") as out:
+            # unbuffered, so that the output following the last snapshot
+            # reaches the file and has to be truncated on resume
+            p = subprocess.Popen(asmera + ["--checkpoint", checkpoint, "--checkpoint-every", "1", filename],
+                                 stdout=out, env=dict(os.environ, PYTHONUNBUFFERED="1"))
+            # stop once there is a snapshot and output to truncate
+            while p.poll() is None and not (os.path.exists(checkpoint) and os.path.getsize(output) > 0):
+                time.sleep(0.001)
+            p.kill()
+            returncode = p.wait()
+            # a run completing first removes its snapshot
+            if os.path.exists(checkpoint):
+                returncode = subprocess.run(asmera + ["--checkpoint", checkpoint, "--resume", filename],
+                                            stdout=out).returncode
+        with open(output, "rb") as f:
+            sys.stdout.buffer.write(f.read())
+    return returncode
+
+
+def report(index: int, lines: list[str], outputs: dict[str], out_dir: str | None):
+    print(f"case {index}: engines disagree")
+    print("\n".join("    " + line for line in lines))
+    for name, output in outputs.items():
+        print(f"  {name}:")
+        print("".join("    | " + line + "\n" for line in output.splitlines()), end="")
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"case{index}.asm")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"  saved to {path}")
+
+
+def parse_engine(text: str) -> tuple[str, list[str]]:
+    (name, sep, command) = text.partition("=")
+    if sep == "" or len(name) == 0 or len(command) == 0:
+        raise argparse.ArgumentTypeError(f"expected NAME=COMMAND, got {text!r}")
+    return (name, shlex.split(command))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run random ASMera programs through every engine and compare their output")
+    parser.add_argument("--count", metavar="N", type=int, default=100,
+                        help="number of programs to generate")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="random seed, printed when not given")
+    parser.add_argument("--engine", metavar="NAME=COMMAND", dest="engines",
+                        type=parse_engine, action="append", default=list(),
+                        help="additional engine to compare, the program file is appended to COMMAND")
+    parser.add_argument("--only", metavar="NAME", action="append",
+                        help="restrict the comparison to these engines")
+    parser.add_argument("--timeout", metavar="SECONDS", type=float, default=10,
+                        help="time limit of one engine run")
+    parser.add_argument("--out", metavar="DIR",
+                        help="save the minimised failing programs to DIR")
+    parser.add_argument("--no-minimise", action="store_true",
+                        help="report failing programs as generated")
+    # used by the "ASMera.py resumed" engine
+    parser.add_argument("--run-resumed", metavar="FILE", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.run_resumed is not None:
+        sys.exit(run_resumed(args.run_resumed))
+
+    engines = dict(ENGINES)
+    engines.update(args.engines)
+    if args.only is not None:
+        engines = {name: command for name, command in engines.items() if name in args.only}
+    if len(engines) < 2:
+        print("At least two engines are needed", file=sys.stderr)
+        sys.exit(2)
+
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    print(f"seed {seed}, engines: {', '.join(engines)}")
+    generator = ProgramGenerator(random.Random(seed))
+
+    failures = 0
+    for i in range(args.count):
+        lines = generator.generate()
+        outputs = run_engines(engines, lines, args.timeout)
+        if not diverging(outputs):
+            continue
+        failures += 1
+        if not args.no_minimise:
+            lines = minimise(lines, failure_test(engines, outputs, args.timeout))
+            outputs = run_engines(engines, lines, args.timeout)
+        report(i, lines, outputs, args.out)
+
+    print(f"{args.count - failures}/{args.count} programs agree")
+    if failures > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()